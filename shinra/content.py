@@ -1,4 +1,5 @@
 import bisect
+from array import array
 from html.parser import HTMLParser
 from typing import Generator, List, Optional, Tuple
 
@@ -6,7 +7,8 @@ from typing import Generator, List, Optional, Tuple
 class Content:
     def __init__(self, raw_content: str) -> None:
         assert raw_content
-        self._line_offsets = tuple(self._gen_line_offsets(raw_content))
+        # Keep offsets in a compact array rather than a tuple of int objects.
+        self._line_offsets = array('q', self._gen_line_offsets(raw_content))
         self._raw_content = raw_content
 
     @property
@@ -15,15 +17,19 @@ class Content:
 
     @staticmethod
     def _gen_line_offsets(raw_content: str) -> Generator[int, None, None]:
-        offset = 0
         # Do not use raw_content.splitlines(keepends=True) because it also
         # splits a string into lines by Unicode line separators such as \u2028
         # and \u2029.
         # https://docs.python.org/3.6/library/stdtypes.html#str.splitlines
-        for line in raw_content.split('\n'):
+        # Find '\n' instead of splitting the content to avoid allocating lines.
+        offset = 0
+        while True:
             yield offset
-            offset += len(line) + 1  # +1 for '\n'.
-        yield offset
+            index = raw_content.find('\n', offset)
+            if index < 0:
+                break
+            offset = index + 1  # +1 for '\n'.
+        yield len(raw_content) + 1
 
     def get_char_offset(self, line_id: int, offset: int) -> int:
         return self._line_offsets[line_id] + offset
@@ -53,8 +59,14 @@ class Content:
 
     @classmethod
     def from_file(cls, file_path: str) -> 'Content':
-        with open(file_path, 'r') as fin:
-            return cls(fin.read())
+        # Read the whole file at once and decode it in a single pass, which is
+        # faster than reading it through a text stream.
+        with open(file_path, 'rb', buffering=0) as fin:
+            raw_content = fin.read().decode('utf-8')
+        if '\r' in raw_content:
+            # Translate newlines in the same way as the universal newlines mode.
+            raw_content = raw_content.replace('\r\n', '\n').replace('\r', '\n')
+        return cls(raw_content)
 
 
 class _HtmlCleaner(HTMLParser):
@@ -64,11 +76,14 @@ class _HtmlCleaner(HTMLParser):
         super().__init__(convert_charrefs=False)
 
     def clean(self, content: Content) -> str:
+        # Reset the parser state left by the previous call to reuse this
+        # instance.
+        self.reset()
         self._script_tag_stack: List[str] = []
         self._content = content
-        self._cleaned_content = list(content.raw_content)
+        self._blank_ranges: List[Tuple[int, int]] = []
         self.feed(content.raw_content)
-        return ''.join(self._cleaned_content)
+        return self._blank(content.raw_content, self._blank_ranges)
 
     def handle_decl(self, decl: str) -> None:
         (tag_start_line_id, tag_start_offset) = self._get_position()
@@ -126,22 +141,52 @@ class _HtmlCleaner(HTMLParser):
 
     def _set_blank(self, start_char_offset: int, end_char_offset: int) -> None:
         # start_char_offset is inclusive whereas end_char_offset is exclusive.
-        for i in range(start_char_offset, end_char_offset):
-            # Do not overwrite newline characters.
-            if not self._is_newline(self._cleaned_content[i]):
-                self._cleaned_content[i] = ' '
+        # Only record the range here and blank all the ranges at once later.
+        # Offsets computed from a broken tag may exceed the content, so clamp
+        # them to keep the length of the content.
+        end_char_offset = min(end_char_offset,
+                              len(self._content.raw_content))
+        if start_char_offset < end_char_offset:
+            self._blank_ranges.append((start_char_offset, end_char_offset))
 
     @staticmethod
-    def _is_newline(char: str) -> bool:
-        return char == '\n'
+    def _blank(raw_content: str, blank_ranges: List[Tuple[int, int]]) -> str:
+        chunks: List[str] = []
+        last_end_char_offset = 0
+        # Ranges are recorded in the parsing order, so sorting is almost free.
+        for (start_char_offset, end_char_offset) in sorted(blank_ranges):
+            start_char_offset = max(start_char_offset, last_end_char_offset)
+            if start_char_offset >= end_char_offset:
+                continue
+            chunks.append(raw_content[last_end_char_offset:start_char_offset])
+            if raw_content.find(
+                    '\n', start_char_offset, end_char_offset) < 0:
+                # Most tags are in a single line.
+                chunks.append(' ' * (end_char_offset - start_char_offset))
+            else:
+                text = raw_content[start_char_offset:end_char_offset]
+                # Do not overwrite newline characters.
+                chunks.append('\n'.join(' ' * len(line)
+                                        for line in text.split('\n')))
+            last_end_char_offset = end_char_offset
+        chunks.append(raw_content[last_end_char_offset:])
+        return ''.join(chunks)
 
     @staticmethod
     def _is_script_tag(tag: str) -> bool:
-        return tag.strip().lower() == 'script'
+        # HTMLParser passes tag names in lowercase.
+        return tag == 'script'
+
+
+# Reuse a single cleaner per process to avoid setting up a parser per call.
+_HTML_CLEANER = _HtmlCleaner()
 
 
 def clean_html(content: Content) -> str:
-    return _HtmlCleaner().clean(content)
+    if '<' not in content.raw_content:
+        # Nothing to remove without any tag or comment.
+        return content.raw_content
+    return _HTML_CLEANER.clean(content)
 
 
 def clean_html_content(content: Content) -> Content:
@@ -2,9 +2,13 @@ import os
 import platform
 import shutil
 import subprocess
+import zipfile
+from array import array
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
 from multiprocessing import Pool
-from tempfile import TemporaryDirectory
-from typing import NamedTuple, Set
+from tempfile import TemporaryDirectory, mkdtemp
+from typing import Generator, NamedTuple, Optional, Set, Tuple
 
 from tqdm import tqdm
 
@@ -19,9 +23,9 @@ class DatasetArrangerException(Exception):
     pass
 
 
-def _unzip(zip_file_path: str, output_dir: str) -> None:
-    # Call `tar` or `unzip` because zipfile.ZipFile does not work for the SHINRA
-    # 2019 dataset.
+def _start_unzip(zip_file_path: str, output_dir: str) -> subprocess.Popen:
+    # Call `tar` or `unzip` because zipfile.ZipFile does not work for the
+    # dataset zip files of SHINRA 2019 and some zip files inside them.
     util.makedirs(output_dir)
     system = platform.system()
     if system == 'Darwin':  # Mac
@@ -30,14 +34,23 @@ def _unzip(zip_file_path: str, output_dir: str) -> None:
         command = ' '.join(('unzip', zip_file_path, '-d', output_dir))
     else:
         raise DatasetArrangerException(f'Unsupported system: {system}')
-    proc = subprocess.Popen(command,
+    # Discard outputs instead of piping them so that the command never blocks
+    # on a full pipe while the caller does other work.
+    return subprocess.Popen(command,
                             shell=True,
-                            stdin=subprocess.PIPE,
-                            stdout=subprocess.PIPE,
-                            stderr=subprocess.PIPE)
-    proc.communicate()
-    if proc.returncode != 0:
-        _LOG.warning(f'Non-zero code returned: {proc.returncode}')
+                            stdin=subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+
+
+def _wait_unzip(proc: subprocess.Popen) -> None:
+    returncode = proc.wait()
+    if returncode != 0:
+        _LOG.warning(f'Non-zero code returned: {returncode}')
+
+
+def _unzip(zip_file_path: str, output_dir: str) -> None:
+    _wait_unzip(_start_unzip(zip_file_path, output_dir))
 
 
 class _UnzipTaskArgs(NamedTuple):
@@ -47,13 +60,19 @@ class _UnzipTaskArgs(NamedTuple):
 
 
 def _unzip_task(args: _UnzipTaskArgs) -> None:
-    md5_digest = util.md5(args.zip_file_path)
+    # Compute the MD5 digest while unzipping so that both read the zip file
+    # through the page cache at the same time. The output directory is
+    # temporary, so the unzipped files of a broken zip file are discarded.
+    proc = _start_unzip(args.zip_file_path, args.output_dir)
+    try:
+        md5_digest = util.md5(args.zip_file_path)
+    finally:
+        _wait_unzip(proc)
     if md5_digest != args.expected_md5_digest:
         raise DatasetArrangerException(
             'MD5 digest mismatch: '
             f'actual:{md5_digest} expected:{args.expected_md5_digest}'
         )
-    return _unzip(args.zip_file_path, args.output_dir)
 
 
 class _UnzipInsideTaskArgs(NamedTuple):
@@ -61,22 +80,97 @@ class _UnzipInsideTaskArgs(NamedTuple):
     output_dir: str
 
 
+def _needs_external_unzip(zip_info: zipfile.ZipInfo) -> bool:
+    # zipfile.ZipFile decodes file names as cp437 unless the UTF-8 flag is set,
+    # so leave non-ASCII names without the flag to `tar` or `unzip`.
+    if zip_info.flag_bits & 0x800:
+        return False
+    try:
+        zip_info.filename.encode('ascii')
+    except UnicodeEncodeError:
+        return True
+    return False
+
+
+def _move_tree(src_dir: str, dst_dir: str) -> None:
+    # Move files into a directory which may already have other files.
+    util.makedirs(dst_dir)
+    with os.scandir(src_dir) as entries:
+        for entry in entries:
+            dst_path = os.path.join(dst_dir, entry.name)
+            if entry.is_dir(follow_symlinks=False) \
+                    and os.path.isdir(dst_path):
+                _move_tree(entry.path, dst_path)
+            else:
+                os.replace(entry.path, dst_path)
+
+
+def _unzip_natively(zip_file_path: str, output_dir: str) -> bool:
+    # Unzip without spawning a process. Return False if zipfile.ZipFile cannot
+    # handle the zip file. Unzip into a new directory first, so that files
+    # already in the output directory are kept on failure.
+    tmp_dir = mkdtemp(dir=os.path.dirname(output_dir))
+    try:
+        try:
+            with zipfile.ZipFile(zip_file_path) as zip_file:
+                if any(_needs_external_unzip(zip_info)
+                       for zip_info in zip_file.infolist()):
+                    return False
+                zip_file.extractall(tmp_dir)
+        except Exception as e:
+            # zipfile.ZipFile raises various errors for broken zip files, e.g.
+            # zlib.error, EOFError, OSError, and UnicodeDecodeError on names
+            # with the UTF-8 flag, as well as RuntimeError for encryption.
+            _LOG.debug(f'Failed to unzip natively: {zip_file_path}: {e}')
+            return False
+        _move_tree(tmp_dir, output_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return True
+
+
 def _unzip_inside_task(args: _UnzipInsideTaskArgs) -> None:
-    return _unzip(args.zip_file_path, args.output_dir)
+    # Zip files inside the dataset zip files are small and many, so avoid
+    # spawning a process for each of them.
+    if not _unzip_natively(args.zip_file_path, args.output_dir):
+        _unzip(args.zip_file_path, args.output_dir)
+    # Remove the unzipped zip file right away to reduce the peak disk usage.
+    os.remove(args.zip_file_path)
 
 
-class _MoveTaskArgs(NamedTuple):
-    src_file_path: str
-    dst_file_path: str
+def _scan_files(dir_path: str) \
+        -> Generator[Tuple[str, os.DirEntry], None, None]:
+    # Yield files under a given directory recursively with their directory
+    # paths. Unlike os.walk, this does not build lists of names for each
+    # directory, and DirEntry caches the results of stat calls.
+    dir_paths = [dir_path]
+    while dir_paths:
+        current_dir_path = dir_paths.pop()
+        with os.scandir(current_dir_path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    dir_paths.append(entry.path)
+                else:
+                    yield (current_dir_path, entry)
 
 
-def _move_task(args: _MoveTaskArgs) -> None:
-    if os.path.getsize(args.src_file_path) == 0:
-        _LOG.warning(f'Skip empty file: {args.src_file_path}')
+def _move_file(src_entry: os.DirEntry, dst_file_path: str) -> None:
+    if src_entry.stat().st_size == 0:
+        _LOG.warning(f'Skip empty file: {src_entry.path}')
         return
-    shutil.move(args.src_file_path, args.dst_file_path)
+    # Files are just renamed because the temporary directory is in the dataset
+    # directory, i.e. on the same file system.
+    os.rename(src_entry.path, dst_file_path)
     # TODO: Compress the file by gzip if needed.
-    os.chmod(args.dst_file_path, 0o444)
+    os.chmod(dst_file_path, 0o444)
+
+
+def _list_page_ids(dir_path: str, extension: str) -> array:
+    # Sorted page ids are unique if no adjacent ones are equal.
+    page_ids = array('q', sorted(dataset.iter_page_ids(dir_path, extension)))
+    assert all(page_id < next_page_id for (page_id, next_page_id)
+               in zip(page_ids, islice(page_ids, 1, None)))
+    return page_ids
 
 
 def arrange_dataset(dataset_dir: str) -> None:
@@ -89,73 +183,72 @@ def arrange_dataset(dataset_dir: str) -> None:
                 output_dir=os.path.join(tmp_dir, dataset_file_name))
             for (dataset_file_name,
                  md5_digest) in dataset.DATASET_FILE_NAMES.items())
-        with Pool() as pool:
-            for unused in tqdm(pool.imap(_unzip_task,
-                                         unzip_task_args_list,
-                                         chunksize=1),
-                               total=len(unzip_task_args_list)):
-                pass
+        # Use threads because the tasks wait for subprocesses and hash files
+        # without holding the GIL.
+        with ThreadPoolExecutor(
+                max_workers=len(unzip_task_args_list)) as executor:
+            futures = tuple(
+                executor.submit(_unzip_task, unzip_task_args)
+                for unzip_task_args in unzip_task_args_list)
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                future.result()
         _LOG.info('Unzipping zip files inside the dataset zip files.')
         unzip_inside_task_args_list = []
         for dataset_file_name in dataset.DATASET_FILE_NAMES.keys():
-            for (root, unused,
-                 files) in os.walk(os.path.join(tmp_dir, dataset_file_name)):
-                for file_name in files:
-                    if not file_name.endswith('.zip'):
-                        continue
-                    zip_file_path = os.path.join(root, file_name)
-                    if os.path.getsize(zip_file_path) == 0:
-                        _LOG.warning(f'Skip empty zip file: {zip_file_path}')
-                        continue
-                    unzip_inside_task_args_list.append(
-                        _UnzipInsideTaskArgs(
-                            zip_file_path=zip_file_path,
-                            output_dir=os.path.splitext(zip_file_path)[0]))
+            for (unused, entry) in _scan_files(
+                    os.path.join(tmp_dir, dataset_file_name)):
+                if not entry.name.endswith('.zip'):
+                    continue
+                zip_file_path = entry.path
+                if entry.stat().st_size == 0:
+                    _LOG.warning(f'Skip empty zip file: {zip_file_path}')
+                    continue
+                unzip_inside_task_args_list.append(
+                    _UnzipInsideTaskArgs(
+                        zip_file_path=zip_file_path,
+                        output_dir=os.path.splitext(zip_file_path)[0]))
         with Pool() as pool:
-            for unused in tqdm(pool.imap(_unzip_inside_task,
-                                         unzip_inside_task_args_list,
-                                         chunksize=1),
-                               total=len(unzip_inside_task_args_list)):
+            # The order does not matter and each task is short.
+            for unused in tqdm(pool.imap_unordered(
+                    _unzip_inside_task,
+                    unzip_inside_task_args_list,
+                    chunksize=8),
+                    total=len(unzip_inside_task_args_list)):
                 pass
         _LOG.info('Moving files.')
-        move_task_args_list = []
-        for dataset_file_name in dataset.DATASET_FILE_NAMES.keys():
-            for (root, unused,
-                 files) in os.walk(os.path.join(tmp_dir, dataset_file_name)):
-                category = dataset.get_category_from_dir_path(root)
-                for file_name in files:
-                    dst_file_path = None
+        # Move files in this process while walking the directories because
+        # moving is bound by cheap system calls rather than CPU, so IPC with
+        # workers costs more than it saves.
+        annotation_dir_path = dataset.make_annotation_dir_path(dataset_dir)
+        made_dir_paths: Set[str] = set()
+        with tqdm() as progress:
+            for dataset_file_name in dataset.DATASET_FILE_NAMES.keys():
+                root: Optional[str] = None
+                category: Optional[str] = None
+                for (dir_path, entry) in _scan_files(
+                        os.path.join(tmp_dir, dataset_file_name)):
+                    if dir_path != root:
+                        # Files are yielded directory by directory.
+                        root = dir_path
+                        category = dataset.get_category_from_dir_path(root)
+                    file_name = entry.name
+                    dst_dir_path = None
                     if file_name.endswith('.json'):
-                        dst_file_path = os.path.join(
-                            dataset.make_annotation_dir_path(dataset_dir),
-                            file_name)
+                        dst_dir_path = annotation_dir_path
                     elif category is not None:
                         if file_name.endswith('.html'):
-                            dst_file_path = os.path.join(
-                                dataset.make_html_dir_path(
-                                    dataset_dir, category),
-                                file_name)
+                            dst_dir_path = dataset.make_html_dir_path(
+                                dataset_dir, category)
                         elif file_name.endswith('.txt'):
-                            dst_file_path = os.path.join(
-                                dataset.make_text_dir_path(
-                                    dataset_dir, category),
-                                file_name)
-                    if dst_file_path is None:
+                            dst_dir_path = dataset.make_text_dir_path(
+                                dataset_dir, category)
+                    if dst_dir_path is None:
                         continue
-                    move_task_args_list.append(
-                        _MoveTaskArgs(
-                            src_file_path=os.path.join(root, file_name),
-                            dst_file_path=dst_file_path))
-        for dst_dir in frozenset(
-                os.path.dirname(move_task_args.dst_file_path)
-                for move_task_args in move_task_args_list):
-            util.makedirs(dst_dir)
-        with Pool() as pool:
-            for unused in tqdm(pool.imap(_move_task,
-                                         move_task_args_list,
-                                         chunksize=500),
-                               total=len(move_task_args_list)):
-                pass
+                    if dst_dir_path not in made_dir_paths:
+                        util.makedirs(dst_dir_path)
+                        made_dir_paths.add(dst_dir_path)
+                    _move_file(entry, os.path.join(dst_dir_path, file_name))
+                    progress.update()
     _LOG.info('Validating the arranged data.')
     for category in dataset.ALL_CATEGORIES:
         assert os.path.exists(
@@ -164,18 +257,10 @@ def arrange_dataset(dataset_dir: str) -> None:
         assert os.path.exists(
             os.path.join(dataset.make_annotation_dir_path(dataset_dir),
                          f'{category}_dist_for_view.json'))
-        html_page_ids: Set[int] = set()
-        for file_name in os.listdir(dataset.make_html_dir_path(dataset_dir,
-                                                               category)):
-            page_id = dataset.get_page_id_from_file_path(file_name)
-            assert page_id not in html_page_ids
-            html_page_ids.add(page_id)
-        text_page_ids: Set[int] = set()
-        for file_name in os.listdir(dataset.make_text_dir_path(dataset_dir,
-                                                               category)):
-            page_id = dataset.get_page_id_from_file_path(file_name)
-            assert page_id not in text_page_ids
-            text_page_ids.add(page_id)
+        html_page_ids = _list_page_ids(
+            dataset.make_html_dir_path(dataset_dir, category), '.html')
+        text_page_ids = _list_page_ids(
+            dataset.make_text_dir_path(dataset_dir, category), '.txt')
         assert html_page_ids
         assert text_page_ids
         assert html_page_ids == text_page_ids
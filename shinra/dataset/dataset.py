@@ -1,7 +1,13 @@
-import json
 import os.path
+import sys
 from collections import defaultdict
-from typing import Any, Dict, List, NamedTuple, Optional
+from typing import Any, Dict, Generator, List, NamedTuple, Optional, Union
+
+try:
+    # orjson parses annotation lines much faster if available.
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads  # type: ignore
 
 DATASET_FILE_NAMES = {
     # File name and md5 digest of its content.
@@ -50,18 +56,31 @@ ALL_CATEGORIES = JP5_CATEGORIES.union(
     JP30_LOCATION_CATEGORIES).union(JP30_ORGANIZATION_CATEGORIES)
 
 
+def get_page_id_from_file_name(file_name: str) -> int:
+    return int(file_name.partition('.')[0])
+
+
+def iter_page_ids(dir_path: str, extension: str) \
+        -> Generator[int, None, None]:
+    # A missing directory has no pages.
+    if not os.path.isdir(dir_path):
+        return
+    # List names instead of scanning directory entries because only names are
+    # needed.
+    for file_name in os.listdir(dir_path):
+        if file_name.endswith(extension):
+            yield get_page_id_from_file_name(file_name)
+
+
 def get_page_id_from_file_path(file_path: str) -> int:
-    return int(os.path.basename(file_path).split('.')[0])
+    return get_page_id_from_file_name(os.path.basename(file_path))
 
 
 def get_category_from_dir_path(dir_path: str) -> Optional[str]:
-    (head, tail) = os.path.split(dir_path)
-    while True:
-        if tail in ALL_CATEGORIES:
-            return tail
-        if not head or not tail:
-            break
-        (head, tail) = os.path.split(head)
+    # Find the deepest directory named after a category.
+    for dir_name in reversed(dir_path.split(os.sep)):
+        if dir_name in ALL_CATEGORIES:
+            return dir_name
     return None
 
 
@@ -119,25 +138,33 @@ def make_offset(data: Dict[str, Any]) -> Offset:
         text=data.get('text'))
 
 
+def _intern(value: Optional[str]) -> Optional[str]:
+    return None if value is None else sys.intern(value)
+
+
 def make_annotation(annotation_id: int, data: Dict[str, Any]) -> Annotation:
+    # Intern strings shared by many annotations, e.g. attributes of a category
+    # and titles of a page, to keep a single copy of each of them in memory.
     return Annotation(
         annotation_id=annotation_id,
         page_id=int(data['page_id']),
-        title=data.get('title'),
-        ene=data.get('ene'),
-        attribute=data['attribute'],
+        title=_intern(data.get('title')),
+        ene=_intern(data.get('ene')),
+        attribute=sys.intern(data['attribute']),
         html_offset=make_offset(data['html_offset']),
         text_offset=make_offset(data['text_offset']))
 
 
-def parse_annotation_line(annotation_id: int, line: str) -> Annotation:
-    return make_annotation(annotation_id, json.loads(line))
+def parse_annotation_line(annotation_id: int, line: Union[str, bytes]) \
+        -> Annotation:
+    return make_annotation(annotation_id, _json_loads(line))
 
 
 def read_annotations_by_page_id(annotation_file_path: str) \
         -> Dict[int, List[Annotation]]:
     annotations_by_page_id: Dict[int, List[Annotation]] = defaultdict(list)
-    with open(annotation_file_path, 'r') as fin:
+    # Read lines as bytes because the JSON parser decodes them by itself.
+    with open(annotation_file_path, 'rb') as fin:
         for (annotation_id, line) in enumerate(fin):
             # Use a line id in the file as annotation id.
             annotation = parse_annotation_line(annotation_id, line)
@@ -1,13 +1,21 @@
 import enum
+import functools
+import heapq
 import html
+import io
 import os.path
+import pickle
 import re
 import unicodedata
+from array import array
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from itertools import chain
-from multiprocessing import Pool
-from typing import (Any, DefaultDict, Generator, List, NamedTuple, Optional,
-                    Tuple)
+from multiprocessing.pool import Pool
+from tempfile import TemporaryFile
+from typing import (IO, Any, DefaultDict, Dict, Generator, Iterable, List,
+                    NamedTuple, Optional, Tuple)
 
 from tqdm import tqdm
 
@@ -16,11 +24,18 @@ from shinra.content import Content, clean_html_content
 from shinra.dataset import dataset
 
 
+class _PageAnnotations(NamedTuple):
+    page_id: int
+    annotations: Tuple[dataset.Annotation, ...]
+    html_file_exists: bool
+    text_file_exists: bool
+
+
 class _InspectAnnotationsTaskArgs(NamedTuple):
     dataset_dir: str
     category: str
-    page_id: int
-    annotations: Tuple[dataset.Annotation, ...]
+    # Pages inspected in a task share the dataset directory and the category.
+    pages: Tuple[_PageAnnotations, ...]
 
 
 class ErrorType(enum.Enum):
@@ -80,10 +95,24 @@ class _InspectAnnotationsTaskResult(NamedTuple):
     annotation: Optional[dataset.Annotation]
 
 
-class _InspectResult(NamedTuple):
-    error_type: ErrorType
-    error_detail: str
-    annotation: dataset.Annotation
+# A result sent from a worker, which is
+# (error type value, page ID, annotation ID, CSV row without the category).
+# The leading values are the sort key, and the CSV row is formatted from
+# _InspectAnnotationsTaskResult in the worker, so that the parent only has to
+# write it after the category. Each value but the small sort key crosses the
+# pipe once. Plain values are lighter to pickle than NamedTuple instances.
+_SlimInspectAnnotationsTaskResult = Tuple[int, int, Optional[int], str]
+
+# A result made in a worker, which is
+# (error type value, page ID, annotation ID, error detail, CSV row) and is
+# sorted by the error detail as well before it is sent.
+_FullInspectAnnotationsTaskResult = \
+    Tuple[int, int, Optional[int], str, str]
+
+
+# A result of checks, which is (error type, error detail, annotation).
+# Plain tuples are cheaper to make than NamedTuple instances.
+_InspectResult = Tuple[ErrorType, str, dataset.Annotation]
 
 
 def _make_file_name(prefix: str) -> str:
@@ -93,39 +122,67 @@ def _make_file_name(prefix: str) -> str:
 # An annotation should not contain the following HTML tags.
 # TODO: Confirm that an annotation with </dt> like "東京都</dt><dd>調布市" is valid or
 # not.
-_HTML_BLOCK_TAGS = frozenset(
-    ('html',
-     'body',
-     'header',
-     'footer',
-     'h1',
-     'h2',
-     'h3',
-     'h4',
-     'h5',
-     'h6',
-     'dl',
-     'dd',
-     'dt',
-     'table',
-     'caption',
-     'thead'
-     'tbody',
-     'tfoot',
-     'th'
-     'tr',
-     'td',
-     'img',
-     # TODO: Add more.
-     ))
-
+_HTML_BLOCK_TAGS = (
+    'html',
+    'body',
+    'header',
+    'footer',
+    'h1',
+    'h2',
+    'h3',
+    'h4',
+    'h5',
+    'h6',
+    'dl',
+    'dd',
+    'dt',
+    'table',
+    'caption',
+    'thead',
+    'tbody',
+    'tfoot',
+    'th',
+    'tr',
+    'td',
+    'img',
+    # TODO: Add more.
+)
+
+
+def _make_trie_pattern(words: Iterable[str]) -> str:
+    # Make a regular expression pattern matching any of given words, whose
+    # alternatives are factored by common prefixes like "t(?:able|d|h)".
+    # The regular expression engine then tries each character once per
+    # position instead of trying every word.
+    trie: Dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = {}  # The end of a word.
+
+    def make_pattern(node: Dict[str, Any]) -> str:
+        alternatives = [re.escape(ch) + make_pattern(child)
+                        for (ch, child) in sorted(node.items()) if ch]
+        if not alternatives:
+            return ''
+        if len(alternatives) == 1 and '' not in node:
+            return alternatives[0]
+        pattern = '(?:' + '|'.join(alternatives) + ')'
+        return pattern + '?' if '' in node else pattern
+
+    return make_pattern(trie)
+
+
+# Match case-insensitively instead of lowering the whole text to search.
 _RE_HTML_BLOCK_TAGS = re.compile(
-    r'</?\s*(?:' + '|'.join(sorted(_HTML_BLOCK_TAGS)) + r'\s*)>')
+    r'</?\s*' + _make_trie_pattern(_HTML_BLOCK_TAGS) + r'\s*>',
+    re.IGNORECASE)
 
 
 def _find_html_block_tag(html_text: str) -> Optional[str]:
-    m = _RE_HTML_BLOCK_TAGS.search(html_text.lower())
-    return None if m is None else m.group(0)
+    m = _RE_HTML_BLOCK_TAGS.search(html_text)
+    return None if m is None else m.group(0).lower()
 
 
 _BRACE_PAIRS = (
@@ -143,20 +200,43 @@ _CLOSE_BRACE_TO_OPEN = {
     close_brace: open_brace for (open_brace, close_brace) in _BRACE_PAIRS}
 
 
+# Map open braces to their close braces and close braces to ''. Characters
+# which are not braces are classified by a single lookup.
+_BRACE_TO_CLOSE = dict(_OPEN_BRACE_TO_CLOSE)
+_BRACE_TO_CLOSE.update(
+    (close_brace, '') for close_brace in _CLOSE_BRACE_TO_OPEN)
+
+_RE_BRACES = re.compile(
+    '[' + ''.join(re.escape(brace) for brace in _BRACE_TO_CLOSE) + ']')
+
+
+# The same texts like names of countries are annotated in many pages.
+@functools.lru_cache(maxsize=4096)
+def _normalize_nfkc(text: str) -> str:
+    # Most texts are already normalized. unicodedata.is_normalized() is
+    # available since Python 3.8.
+    if (hasattr(unicodedata, 'is_normalized')
+            and unicodedata.is_normalized('NFKC', text)):
+        return text
+    return unicodedata.normalize('NFKC', text)
+
+
 def _braces_paired(text: str) -> bool:
-    normalized_text = unicodedata.normalize('NFKC', text)
+    normalized_text = _normalize_nfkc(text)
+    if _BRACE_TO_CLOSE.keys().isdisjoint(normalized_text):
+        # Most texts have no braces, which is checked without a Python loop.
+        return True
+    # Push the close brace expected for each open brace, which makes matching
+    # a close brace a single comparison.
     braces_stack = []
-    for ch in normalized_text:
-        if ch in _OPEN_BRACE_TO_CLOSE:
-            braces_stack.append(ch)
-        elif ch in _CLOSE_BRACE_TO_OPEN:
-            if not braces_stack:
-                # No corresponding open brace.
-                return False
-            last_open_brace = braces_stack.pop()
-            if _CLOSE_BRACE_TO_OPEN[ch] != last_open_brace:
-                # No corresponding open brace.
-                return False
+    # Only iterate braces found by the regular expression engine.
+    for ch in _RE_BRACES.findall(normalized_text):
+        close_brace = _BRACE_TO_CLOSE[ch]
+        if close_brace:
+            braces_stack.append(close_brace)
+        elif not braces_stack or braces_stack.pop() != ch:
+            # No corresponding open brace.
+            return False
     if braces_stack:
         # No corresponding close brace.
         return False
@@ -168,268 +248,374 @@ class _DetectOverlapAnnotationsResult(NamedTuple):
     overlapped_annotation: dataset.Annotation
 
 
-def _is_overlapped(start_offset_a: int, end_offset_a: int,
-                   start_offset_b: int, end_offset_b: int) -> bool:
-    # Start offset is inclusive whereas end offset is exclusive.
-    assert start_offset_a < end_offset_a
-    assert start_offset_b < end_offset_b
-    return not (end_offset_a <= start_offset_b
-                or end_offset_b <= start_offset_a)
-
-
 def _detect_overlap_annotations(
         sorted_indexed_annotations:
         Tuple[Tuple[int, int, dataset.Annotation], ...]) \
         -> Generator[_DetectOverlapAnnotationsResult, None, None]:
+    # Every annotation compared with annotation_a but the last one overlaps
+    # with it, so this takes O(n + k) time for k overlapped pairs.
     for i in range(len(sorted_indexed_annotations)):
         (start_offset_a, end_offset_a,
          annotation_a) = sorted_indexed_annotations[i]
         for j in range(i + 1, len(sorted_indexed_annotations)):
-            (start_offset_b, end_offset_b, annotation_b) \
-                = sorted_indexed_annotations[j]
+            (start_offset_b, end_offset_b,
+             annotation_b) = sorted_indexed_annotations[j]
             if end_offset_a <= start_offset_b:
                 break
-            if _is_overlapped(
-                    start_offset_a, end_offset_a, start_offset_b, end_offset_b):
-                yield _DetectOverlapAnnotationsResult(
-                    annotation=annotation_a,
-                    overlapped_annotation=annotation_b)
+            # Start offset is inclusive whereas end offset is exclusive.
+            assert start_offset_a < end_offset_a
+            assert start_offset_b < end_offset_b
+            # Annotations are sorted by start offsets, so annotation_b starts
+            # within annotation_a, which means they are overlapped.
+            yield _DetectOverlapAnnotationsResult(
+                annotation=annotation_a,
+                overlapped_annotation=annotation_b)
+
+
+def _has_leading_or_trailing_space(text: str) -> bool:
+    # Same as text.strip() != text but only looks at both ends of the text
+    # without making a stripped copy.
+    return bool(text) and (text[0].isspace() or text[-1].isspace())
 
 
 def _check_html_text(
         content: Content, annotations: Tuple[dataset.Annotation, ...]) \
         -> Generator[_InspectResult, None, None]:
-    annotations_by_attribute: DefaultDict[str, List[dataset.Annotation]] \
+    indexed_annotations_by_attribute: \
+        DefaultDict[str, List[Tuple[int, int, dataset.Annotation]]] \
         = defaultdict(list)
-    clean_content = clean_html_content(content)
+    # Clean the HTML only when an annotation passes the checks before it.
+    clean_content: Optional[Content] = None
     for annotation in annotations:
-        annotations_by_attribute[annotation.attribute].append(annotation)
         offset = annotation.html_offset
-        if offset is not None and offset.text is not None:
-            text = content.get_text(
-                offset.start.line_id,
-                offset.start.offset,
-                offset.end.line_id,
-                offset.end.offset)
+        # Resolve the offsets once for the checks and the overlap detection.
+        # The clean content has the same lines as the content, so the offsets
+        # are also used for it.
+        start_char_offset = content.get_char_offset(*offset.start)
+        end_char_offset = content.get_char_offset(*offset.end)
+        indexed_annotations_by_attribute[annotation.attribute].append(
+            (start_char_offset, end_char_offset, annotation))
+        if offset.text is not None:
+            text = content.get_text_by_char_offset(
+                start_char_offset, end_char_offset)
             if text != offset.text:
-                yield _InspectResult(
-                    error_type=ErrorType.HTML_OFFSET_MISMATCH,
-                    error_detail=f'"{offset.text}" != "{text}"',
-                    annotation=annotation)
+                yield (
+                    ErrorType.HTML_OFFSET_MISMATCH,
+                    f'"{offset.text}" != "{text}"',
+                    annotation)
                 continue
-            stripped_text = offset.text.strip()
-            if stripped_text != text:
-                yield _InspectResult(
-                    error_type=ErrorType.HTML_LEADING_OR_TRAILING_SPACE,
-                    error_detail=f'"{offset.text}"',
-                    annotation=annotation)
+            if _has_leading_or_trailing_space(text):
+                yield (
+                    ErrorType.HTML_LEADING_OR_TRAILING_SPACE,
+                    f'"{offset.text}"',
+                    annotation)
                 continue
             block_html_tag = _find_html_block_tag(text)
             if block_html_tag:
-                yield _InspectResult(
-                    error_type=ErrorType.HTML_WITH_BLOCK_TAG,
-                    error_detail=f'{block_html_tag} in "{offset.text}"',
-                    annotation=annotation)
+                yield (
+                    ErrorType.HTML_WITH_BLOCK_TAG,
+                    f'{block_html_tag} in "{offset.text}"',
+                    annotation)
                 continue
-            clean_text = clean_content.get_text(
-                offset.start.line_id,
-                offset.start.offset,
-                offset.end.line_id,
-                offset.end.offset)
-            stripped_clean_text = clean_text.strip()
-            if not stripped_clean_text:
-                yield _InspectResult(
-                    error_type=ErrorType.HTML_INVISIBLE_TEXT,
-                    error_detail=f'"{offset.text}"',
-                    annotation=annotation)
+            if clean_content is None:
+                clean_content = clean_html_content(content)
+            clean_text = clean_content.get_text_by_char_offset(
+                start_char_offset, end_char_offset)
+            if not clean_text or clean_text.isspace():
+                yield (
+                    ErrorType.HTML_INVISIBLE_TEXT,
+                    f'"{offset.text}"',
+                    annotation)
                 continue
-            if stripped_clean_text != clean_text:
-                yield _InspectResult(
+            if _has_leading_or_trailing_space(clean_text):
+                yield (
                     # TODO: Cosider using another error type.
-                    error_type=ErrorType.HTML_LEADING_OR_TRAILING_SPACE,
-                    error_detail=f'"{offset.text}"',
-                    annotation=annotation)
+                    ErrorType.HTML_LEADING_OR_TRAILING_SPACE,
+                    f'"{offset.text}"',
+                    annotation)
                 continue
             unescaped_text = html.unescape(clean_text)
-            stripped_unescaped_text = unescaped_text.strip()
-            if stripped_unescaped_text != unescaped_text:
-                yield _InspectResult(
+            if _has_leading_or_trailing_space(unescaped_text):
+                yield (
                     # TODO: Cosider using another error type.
-                    error_type=ErrorType.HTML_LEADING_OR_TRAILING_SPACE,
-                    error_detail=f'"{offset.text}"',
-                    annotation=annotation)
+                    ErrorType.HTML_LEADING_OR_TRAILING_SPACE,
+                    f'"{offset.text}"',
+                    annotation)
                 continue
             if not _braces_paired(unescaped_text):
-                yield _InspectResult(
-                    error_type=ErrorType.HTML_UNPAIRED_BRACES,
-                    error_detail=f'"{offset.text}"',
-                    annotation=annotation)
+                yield (
+                    ErrorType.HTML_UNPAIRED_BRACES,
+                    f'"{offset.text}"',
+                    annotation)
                 continue
             # TODO: Also output a suggestion to modify the annotation.
             # TODO: Detect tokenization mismatch.
-    for (attribute, grouped_annotations) in annotations_by_attribute.items():
-        indexed_annotations = tuple(sorted(
-            (content.get_char_offset(*annotation.html_offset.start),
-             content.get_char_offset(*annotation.html_offset.end),
-             annotation)
-            for annotation in grouped_annotations))
+    for (attribute, indexed_annotations_list) \
+            in indexed_annotations_by_attribute.items():
+        indexed_annotations = tuple(sorted(indexed_annotations_list))
         for result in _detect_overlap_annotations(indexed_annotations):
-            yield _InspectResult(
-                error_type=ErrorType.HTML_OVERLAPPED_ANNOTATIONS,
-                error_detail=(
-                    f'{attribute}:'
-                    + f' annotation "{result.annotation.annotation_id}"'
-                    + ' is overlapped with'
-                    + f' "{result.overlapped_annotation.annotation_id}"'),
-                annotation=result.annotation)
+            yield (
+                ErrorType.HTML_OVERLAPPED_ANNOTATIONS,
+                f'{attribute}:'
+                + f' annotation "{result.annotation.annotation_id}"'
+                + ' is overlapped with'
+                + f' "{result.overlapped_annotation.annotation_id}"',
+                result.annotation)
 
 
 def _check_text_text(
         content: Content, annotations: Tuple[dataset.Annotation, ...]) \
         -> Generator[_InspectResult, None, None]:
-    annotations_by_attribute: DefaultDict[str, List[dataset.Annotation]] \
+    indexed_annotations_by_attribute: \
+        DefaultDict[str, List[Tuple[int, int, dataset.Annotation]]] \
         = defaultdict(list)
     for annotation in annotations:
-        annotations_by_attribute[annotation.attribute].append(annotation)
         offset = annotation.text_offset
-        if offset is not None and offset.text is not None:
-            text = content.get_text(
-                offset.start.line_id,
-                offset.start.offset,
-                offset.end.line_id,
-                offset.end.offset)
+        # Resolve the offsets once for the checks and the overlap detection.
+        start_char_offset = content.get_char_offset(*offset.start)
+        end_char_offset = content.get_char_offset(*offset.end)
+        indexed_annotations_by_attribute[annotation.attribute].append(
+            (start_char_offset, end_char_offset, annotation))
+        if offset.text is not None:
+            text = content.get_text_by_char_offset(
+                start_char_offset, end_char_offset)
             if text != offset.text:
-                yield _InspectResult(
-                    error_type=ErrorType.TEXT_OFFSET_MISMATCH,
-                    error_detail=f'"{offset.text}" != "{text}"',
-                    annotation=annotation)
+                yield (
+                    ErrorType.TEXT_OFFSET_MISMATCH,
+                    f'"{offset.text}" != "{text}"',
+                    annotation)
                 continue
-            stripped_text = offset.text.strip()
-            if stripped_text != text:
-                yield _InspectResult(
-                    error_type=ErrorType.TEXT_LEADING_OR_TRAILING_SPACE,
-                    error_detail=f'"{offset.text}"',
-                    annotation=annotation)
+            if _has_leading_or_trailing_space(text):
+                yield (
+                    ErrorType.TEXT_LEADING_OR_TRAILING_SPACE,
+                    f'"{offset.text}"',
+                    annotation)
                 continue
             if not _braces_paired(offset.text):
-                yield _InspectResult(
-                    error_type=ErrorType.TEXT_UNPAIRED_BRACES,
-                    error_detail=f'"{offset.text}"',
-                    annotation=annotation)
+                yield (
+                    ErrorType.TEXT_UNPAIRED_BRACES,
+                    f'"{offset.text}"',
+                    annotation)
                 continue
             # TODO: Also output a suggestion to modify the annotation.
             # TODO: Detect tokenization mismatch.
-    for (attribute, grouped_annotations) in annotations_by_attribute.items():
-        indexed_annotations = tuple(sorted(
-            (content.get_char_offset(*annotation.text_offset.start),
-             content.get_char_offset(*annotation.text_offset.end),
-             annotation)
-            for annotation in grouped_annotations))
+    for (attribute, indexed_annotations_list) \
+            in indexed_annotations_by_attribute.items():
+        indexed_annotations = tuple(sorted(indexed_annotations_list))
         for result in _detect_overlap_annotations(indexed_annotations):
-            yield _InspectResult(
-                error_type=ErrorType.TEXT_OVERLAPPED_ANNOTATIONS,
-                error_detail=(
-                    f'{attribute}:'
-                    + f' annotation "{result.annotation.annotation_id}"'
-                    + ' is overlapped with'
-                    + f' "{result.overlapped_annotation.annotation_id}"'),
-                annotation=result.annotation)
-
-
-def _inspect_annotations_task(args: _InspectAnnotationsTaskArgs) \
-        -> Tuple[_InspectAnnotationsTaskResult, ...]:
-    results: List[_InspectAnnotationsTaskResult] = []
+            yield (
+                ErrorType.TEXT_OVERLAPPED_ANNOTATIONS,
+                f'{attribute}:'
+                + f' annotation "{result.annotation.annotation_id}"'
+                + ' is overlapped with'
+                + f' "{result.overlapped_annotation.annotation_id}"',
+                result.annotation)
+
+
+# Reuse a single buffer per process to format CSV rows.
+_ROW_BUFFER = io.StringIO()
+_ROW_WRITER = util.csv_writer(_ROW_BUFFER)
+
+
+def _format_row(row: Iterable[Any]) -> str:
+    _ROW_BUFFER.seek(0)
+    _ROW_BUFFER.truncate()
+    _ROW_WRITER.writerow(row)
+    return _ROW_BUFFER.getvalue()
+
+
+def _make_task_result(
+        error_type: ErrorType, page_id: int,
+        annotation: Optional[dataset.Annotation], error_detail: str) \
+        -> _FullInspectAnnotationsTaskResult:
+    annotation_id = None if annotation is None else annotation.annotation_id
+    # Leave the category shared by all the results to the parent.
+    return (error_type.value, page_id, annotation_id, error_detail,
+            _format_row((error_type, page_id, annotation_id, error_detail,
+                         annotation)))
+
+
+def _inspect_page_annotations(
+        dataset_dir: str, category: str, page: _PageAnnotations) \
+        -> Tuple[_FullInspectAnnotationsTaskResult, ...]:
+    results: List[_FullInspectAnnotationsTaskResult] = []
     html_file_path = os.path.join(
-        dataset.make_html_dir_path(args.dataset_dir, args.category),
-        dataset.make_html_file_name(args.page_id))
+        dataset.make_html_dir_path(dataset_dir, category),
+        dataset.make_html_file_name(page.page_id))
     # TODO: Clean inspection logic. For example, extract checks for both HTML
     # and text.
-    if os.path.exists(html_file_path):
+    if page.html_file_exists:
         html_content = Content.from_file(html_file_path)
-        for result in _check_html_text(html_content, args.annotations):
-            results.append(_InspectAnnotationsTaskResult(
-                category=args.category,
-                error_type=result.error_type,
-                page_id=args.page_id,
-                annotation_id=result.annotation.annotation_id,
-                error_detail=result.error_detail,
-                annotation=result.annotation))
+        for (error_type, error_detail, annotation) in _check_html_text(
+                html_content, page.annotations):
+            results.append(_make_task_result(
+                error_type, page.page_id, annotation, error_detail))
     else:
-        results.append(_InspectAnnotationsTaskResult(
-            category=args.category,
-            error_type=ErrorType.HTML_FILE_NOT_FOUND,
-            page_id=args.page_id,
-            annotation_id=None,
-            error_detail=f'HTML file not found: "{html_file_path}"',
-            annotation=None))
+        results.append(_make_task_result(
+            ErrorType.HTML_FILE_NOT_FOUND, page.page_id, None,
+            f'HTML file not found: "{html_file_path}"'))
     text_file_path = os.path.join(
-        dataset.make_text_dir_path(args.dataset_dir, args.category),
-        dataset.make_text_file_name(args.page_id))
-    if os.path.exists(text_file_path):
+        dataset.make_text_dir_path(dataset_dir, category),
+        dataset.make_text_file_name(page.page_id))
+    if page.text_file_exists:
         text_content = Content.from_file(text_file_path)
-        for result in _check_text_text(text_content, args.annotations):
-            results.append(_InspectAnnotationsTaskResult(
-                category=args.category,
-                error_type=result.error_type,
-                page_id=args.page_id,
-                annotation_id=result.annotation.annotation_id,
-                error_detail=result.error_detail,
-                annotation=result.annotation))
+        for (error_type, error_detail, annotation) in _check_text_text(
+                text_content, page.annotations):
+            results.append(_make_task_result(
+                error_type, page.page_id, annotation, error_detail))
     else:
-        results.append(_InspectAnnotationsTaskResult(
-            category=args.category,
-            error_type=ErrorType.TEXT_FILE_NOT_FOUND,
-            page_id=args.page_id,
-            annotation_id=None,
-            error_detail=f'TEXT file not found: "{text_file_path}"',
-            annotation=None))
+        results.append(_make_task_result(
+            ErrorType.TEXT_FILE_NOT_FOUND, page.page_id, None,
+            f'TEXT file not found: "{text_file_path}"'))
     return tuple(results)
 
 
+def _inspect_annotations_task(args: _InspectAnnotationsTaskArgs) \
+        -> Tuple[_SlimInspectAnnotationsTaskResult, ...]:
+    # Sort results in workers so that the parent only has to merge them.
+    # Error details only break ties within a page, which is in a single
+    # batch, so they are dropped after sorting.
+    return tuple(
+        (error_type_value, page_id, annotation_id, row)
+        for (error_type_value, page_id, annotation_id, _, row)
+        in sorted(chain.from_iterable(
+            _inspect_page_annotations(args.dataset_dir, args.category, page)
+            for page in args.pages)))
+
+
+def _load_results(fin: IO[bytes]) \
+        -> Generator[_SlimInspectAnnotationsTaskResult, None, None]:
+    unpickler = pickle.Unpickler(fin)
+    while True:
+        try:
+            yield unpickler.load()
+        except EOFError:
+            return
+
+
+_SlimInspectAnnotationsTaskResults = \
+    Tuple[_SlimInspectAnnotationsTaskResult, ...]
+
+
+def _dump_results(results: _SlimInspectAnnotationsTaskResults,
+                  fout: IO[bytes]) -> None:
+    # Spill results to a temporary file not to keep all of them in memory.
+    pickler = pickle.Pickler(fout, pickle.HIGHEST_PROTOCOL)
+    for result in results:
+        pickler.dump(result)
+    fout.seek(0)
+
+
 class _InspectAnnotationsByCategoryResult(NamedTuple):
     category: str
     error_count_by_type: DefaultDict[ErrorType, int]
 
 
-def inspect_annotations_by_category(
-        dataset_dir: str, category: str, output_dir: str) \
-        -> _InspectAnnotationsByCategoryResult:
-    annotation_file_path = os.path.join(
+# Results of each batch are spilled to a file and all of the files are open
+# while merging them, so keep the number of files well below the default
+# limit of open files, i.e. 1024.
+_MAX_NUM_BATCHES = 256
+
+
+def _make_annotation_file_path(dataset_dir: str, category: str) -> str:
+    return os.path.join(
         dataset.make_annotation_dir_path(dataset_dir), f'{category}_dist.json')
-    annotations_by_page_id = dataset.read_annotations_by_page_id(
-        annotation_file_path)
-    inspect_annotations_task_args_list = tuple(
-        _InspectAnnotationsTaskArgs(
-            dataset_dir=dataset_dir,
+
+
+def inspect_annotations_by_category(
+        dataset_dir: str, category: str, output_dir: str,
+        pool: Optional[Pool] = None) -> _InspectAnnotationsByCategoryResult:
+    with util.ensure_pool(pool) as pool:
+        annotation_file_path = _make_annotation_file_path(dataset_dir, category)
+        annotations_by_page_id = dataset.read_annotations_by_page_id(
+            annotation_file_path)
+        # List files once instead of checking the existence of files per page.
+        html_page_ids = frozenset(dataset.iter_page_ids(
+            dataset.make_html_dir_path(dataset_dir, category), '.html'))
+        text_page_ids = frozenset(dataset.iter_page_ids(
+            dataset.make_text_dir_path(dataset_dir, category), '.txt'))
+        pages = tuple(
+            _PageAnnotations(
+                page_id=page_id,
+                annotations=tuple(annotations),
+                html_file_exists=(page_id in html_page_ids),
+                text_file_exists=(page_id in text_page_ids))
+            for (page_id, annotations) in annotations_by_page_id.items())
+        # Send pages to workers by batches to amortize IPC overhead per task.
+        batch_size = util.get_chunk_size(
+            len(pages), max_num_chunks=_MAX_NUM_BATCHES)
+        inspect_annotations_task_args_list = tuple(
+            _InspectAnnotationsTaskArgs(
+                dataset_dir=dataset_dir,
+                category=category,
+                pages=pages[i:i + batch_size])
+            for i in range(0, len(pages), batch_size))
+        output_inspection_file_path = os.path.join(
+            output_dir, _make_file_name(category))
+        # Count errors by indexing a fixed size array by error type values
+        # instead of hashing error types.
+        error_counts = array(
+            'Q', [0] * (max(error_type.value for error_type in ErrorType) + 1))
+        with ExitStack() as stack:
+            result_files: List[IO[bytes]] = []
+            # Spill results in another thread so that draining results from
+            # workers does not wait for disk writes.
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                futures = []
+                for results in tqdm(
+                        pool.imap_unordered(_inspect_annotations_task,
+                                            inspect_annotations_task_args_list),
+                        total=len(inspect_annotations_task_args_list)):
+                    # Register a file before spilling results into it, so that
+                    # the file is closed even if spilling fails.
+                    result_file = stack.enter_context(TemporaryFile())
+                    result_files.append(result_file)
+                    futures.append(
+                        executor.submit(_dump_results, results, result_file))
+                # Raise errors on spilling results instead of merging only some
+                # of them.
+                for future in futures:
+                    future.result()
+            with open(output_inspection_file_path, 'w',
+                      buffering=util.CSV_BUFFER_SIZE) as fout:
+                writer = util.csv_writer(fout)
+                writer.writerow(_InspectAnnotationsTaskResult._fields)
+                # The category column followed by a separator.
+                category_cell = _format_row((category, ''))[:-1]
+                # Merge the sorted results of batches by streaming them.
+                # Pages are not split into batches, so sort keys of results
+                # in different batches never tie and rows are not compared.
+                for (error_type_value, _, _, row) in heapq.merge(
+                        *(_load_results(result_file)
+                          for result_file in result_files)):
+                    fout.write(category_cell)
+                    fout.write(row)
+                    error_counts[error_type_value] += 1
+        error_count_by_type: DefaultDict[ErrorType, int] = defaultdict(int)
+        for error_type in ErrorType:
+            if error_counts[error_type.value]:
+                error_count_by_type[error_type] = error_counts[error_type.value]
+        return _InspectAnnotationsByCategoryResult(
             category=category,
-            page_id=page_id,
-            annotations=tuple(annotations))
-        for (page_id, annotations) in annotations_by_page_id.items())
-    output_inspection_file_path = os.path.join(
-        output_dir, _make_file_name(category))
-    error_count_by_type: DefaultDict[ErrorType, int] = defaultdict(int)
-    with Pool() as pool:
-        with open(output_inspection_file_path, 'w') as fout:
-            writer = util.csv_writer(fout)
-            writer.writerow(_InspectAnnotationsTaskResult._fields)
-            for result in sorted(chain.from_iterable(tqdm(
-                pool.imap_unordered(_inspect_annotations_task,
-                                    inspect_annotations_task_args_list,
-                                    chunksize=10),
-                    total=len(inspect_annotations_task_args_list)))):
-                writer.writerow(result)
-                error_count_by_type[result.error_type] += 1
-    return _InspectAnnotationsByCategoryResult(
-        category=category,
-        error_count_by_type=error_count_by_type)
+            error_count_by_type=error_count_by_type)
 
 
 def inspect_annotations(dataset_dir: str, output_dir: str) -> None:
     util.makedirs(output_dir)
-    results = tuple(
-        inspect_annotations_by_category(dataset_dir, category, output_dir)
-        for category in tqdm(sorted(dataset.ALL_CATEGORIES),
-                             total=len(dataset.ALL_CATEGORIES)))
+    # Inspect large categories first, estimating the amount of work by the
+    # size of annotation files, so that the progress is estimated better.
+    categories = sorted(
+        dataset.ALL_CATEGORIES,
+        key=lambda category: (-os.path.getsize(
+            _make_annotation_file_path(dataset_dir, category)), category))
+    # Share workers among categories.
+    with Pool() as pool:
+        results = [
+            inspect_annotations_by_category(
+                dataset_dir, category, output_dir, pool)
+            for category in tqdm(categories, total=len(categories))]
+    # Write the summary in the order of category names as before.
+    results.sort(key=lambda result: result.category)
     summary_file_path = os.path.join(output_dir, _make_file_name('summary'))
     with open(summary_file_path, 'w') as fout:
         writer = util.csv_writer(fout)
@@ -1,10 +1,8 @@
 import enum
 import os
-import re
 from collections import defaultdict
-from itertools import chain
-from multiprocessing import Pool
-from typing import Any, DefaultDict, List, NamedTuple, Tuple
+from multiprocessing.pool import Pool
+from typing import Any, DefaultDict, List, NamedTuple, Optional, Tuple
 
 from tqdm import tqdm
 
@@ -46,14 +44,14 @@ def _make_file_name(prefix: str) -> str:
     return f'{prefix}_page_inspection.csv'
 
 
-_HTML_RESERVED_CHARACTERS = frozenset(('<', '>'))
-
-_RE_HTML_RESERVED_CHARACTERS = re.compile(
-    '|'.join(sorted(_HTML_RESERVED_CHARACTERS)))
+# A tuple keeps the order of characters in error details.
+_HTML_RESERVED_CHARACTERS = ('<', '>')
 
 
 def _contains_html_reserved_character(text: str) -> bool:
-    return _RE_HTML_RESERVED_CHARACTERS.search(text) is not None
+    # Searching a character by the in operator is faster than any regular
+    # expression.
+    return any(ch in text for ch in _HTML_RESERVED_CHARACTERS)
 
 
 def _inspect_page_task(args: _InspectPageTaskArgs) \
@@ -92,46 +90,55 @@ class _InspectPagesByCategoryResult(NamedTuple):
 
 
 def inspect_pages_by_category(
-        dataset_dir: str, category: str, output_dir: str) \
-        -> _InspectPagesByCategoryResult:
-    html_dir_path = dataset.make_html_dir_path(dataset_dir, category)
-    text_dir_path = dataset.make_text_dir_path(dataset_dir, category)
-    inspect_page_task_args_list = []
-    for page_id in frozenset(
-            dataset.get_page_id_from_file_path(file_name)
-            for file_name in chain(os.listdir(os.path.join(html_dir_path)),
-                                   os.listdir(os.path.join(text_dir_path)))):
-        inspect_page_task_args_list.append(
-            _InspectPageTaskArgs(
-                page_id=page_id,
-                html_file_path=os.path.join(
-                    html_dir_path, dataset.make_html_file_name(page_id)),
-                text_file_path=os.path.join(
-                    text_dir_path, dataset.make_text_file_name(page_id))))
-    output_page_file_path = os.path.join(output_dir, _make_file_name(category))
-    error_count_by_type: DefaultDict[ErrorType, int] = defaultdict(int)
-    with Pool() as pool:
+        dataset_dir: str, category: str, output_dir: str,
+        pool: Optional[Pool] = None) -> _InspectPagesByCategoryResult:
+    with util.ensure_pool(pool) as pool:
+        html_dir_path = dataset.make_html_dir_path(dataset_dir, category)
+        text_dir_path = dataset.make_text_dir_path(dataset_dir, category)
+        inspect_page_task_args_list = []
+        page_ids = frozenset(
+            dataset.iter_page_ids(html_dir_path, '.html')).union(
+                dataset.iter_page_ids(text_dir_path, '.txt'))
+        for page_id in page_ids:
+            inspect_page_task_args_list.append(
+                _InspectPageTaskArgs(
+                    page_id=page_id,
+                    html_file_path=os.path.join(
+                        html_dir_path, dataset.make_html_file_name(page_id)),
+                    text_file_path=os.path.join(
+                        text_dir_path, dataset.make_text_file_name(page_id))))
+        output_page_file_path = os.path.join(
+            output_dir, _make_file_name(category))
+        error_count_by_type: DefaultDict[ErrorType, int] = defaultdict(int)
+        results: List[_InspectPageTaskResult] = []
+        for page_results in tqdm(
+                pool.imap_unordered(_inspect_page_task,
+                                    inspect_page_task_args_list,
+                                    chunksize=10),
+                total=len(inspect_page_task_args_list)):
+            results.extend(page_results)
+        # Sort by plain values not to call ErrorType.__lt__() per comparison.
+        results.sort(key=lambda result: (
+            result.error_type.value, result.page_id, result.error_detail))
         with open(output_page_file_path, 'w') as fout:
             writer = util.csv_writer(fout)
             writer.writerow(_InspectPageTaskResult._fields)
-            for result in sorted(chain.from_iterable(tqdm(
-                    pool.imap_unordered(_inspect_page_task,
-                                        inspect_page_task_args_list,
-                                        chunksize=10),
-                    total=len(inspect_page_task_args_list)))):
-                writer.writerow(result)
-                error_count_by_type[result.error_type] += 1
-    return _InspectPagesByCategoryResult(
-        category=category,
-        error_count_by_type=error_count_by_type)
+            writer.writerows(results)
+        for result in results:
+            error_count_by_type[result.error_type] += 1
+        return _InspectPagesByCategoryResult(
+            category=category,
+            error_count_by_type=error_count_by_type)
 
 
 def inspect_pages(dataset_dir: str, output_dir: str) -> None:
     util.makedirs(output_dir)
-    results = tuple(
-        inspect_pages_by_category(dataset_dir, category, output_dir)
-        for category in tqdm(sorted(dataset.ALL_CATEGORIES),
-                             total=len(dataset.ALL_CATEGORIES)))
+    # Share workers among categories.
+    with Pool() as pool:
+        results = tuple(
+            inspect_pages_by_category(dataset_dir, category, output_dir, pool)
+            for category in tqdm(sorted(dataset.ALL_CATEGORIES),
+                                 total=len(dataset.ALL_CATEGORIES)))
     summary_file_path = os.path.join(output_dir, _make_file_name('summary'))
     with open(summary_file_path, 'w') as fout:
         writer = util.csv_writer(fout)
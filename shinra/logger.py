@@ -1,18 +1,22 @@
 import logging
 import os
 
+# Share a single handler among calls not to emit each message repeatedly when
+# get_logger is called more than once.
+_HANDLER = logging.StreamHandler()
+_HANDLER.setFormatter(
+    logging.Formatter(
+        '[%(asctime)s][%(levelname)s](%(filename)s:%(lineno)s) %(message)s'
+    ))
+
 
 def get_logger(level=None):
     if level is None:
         level = os.getenv('LOG_LEVEL', 'INFO')
-    handler = logging.StreamHandler()
-    handler.setLevel(level)
-    handler.setFormatter(
-        logging.Formatter(
-            '[%(asctime)s][%(levelname)s](%(filename)s:%(lineno)s) %(message)s'
-        ))
+    _HANDLER.setLevel(level)
     logger = logging.getLogger()
     logger.setLevel(level)
-    logger.addHandler(handler)
-    logger.propagete = False
+    # This does nothing if the handler is already added.
+    logger.addHandler(_HANDLER)
+    logger.propagate = False
     return logger
@@ -2,6 +2,9 @@ import csv
 import hashlib
 import os
 import sys
+from contextlib import contextmanager
+from multiprocessing.pool import Pool
+from typing import Generator, Optional
 
 
 def confirm(message: str) -> None:
@@ -20,14 +23,23 @@ def makedirs(dir_path: str) -> None:
         pass
 
 
+# Read files by 1 MiB to hash huge zip files with a constant memory footprint.
+_MD5_BLOCK_SIZE = 0x100000
+
+
 def md5(file_path: str) -> str:
-    h = hashlib.new('md5')
-    block_size = h.block_size * 0x1000
-    with open(file_path, 'rb') as fin:
-        data = fin.read(block_size)
-        while data:
-            h.update(data)
-            data = fin.read(block_size)
+    with open(file_path, 'rb', buffering=0) as fin:
+        if hasattr(os, 'posix_fadvise'):
+            # Let the kernel read ahead aggressively.
+            os.posix_fadvise(fin.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        h = hashlib.new('md5')
+        # Reuse a single buffer instead of allocating bytes for each block.
+        buffer = bytearray(_MD5_BLOCK_SIZE)
+        view = memoryview(buffer)
+        size = fin.readinto(buffer)
+        while size:
+            h.update(view[:size])
+            size = fin.readinto(buffer)
     return h.hexdigest().lower()
 
 
@@ -39,5 +51,34 @@ def csv_reader(fin):
     return csv.reader(fin)
 
 
+# Buffer large CSV files by 1 MiB to reduce write system calls.
+CSV_BUFFER_SIZE = 0x100000
+
+
 def csv_writer(fout):
     return csv.writer(fout, lineterminator='\n')
+
+
+@contextmanager
+def ensure_pool(pool: Optional[Pool] = None) -> Generator[Pool, None, None]:
+    # Use a given pool, e.g. one shared among categories, or start a new one.
+    # Enter this before reading large data such as annotations, so that
+    # forked workers do not inherit the data and copy their pages on
+    # reference counting.
+    if pool is not None:
+        yield pool
+        return
+    with Pool() as new_pool:
+        yield new_pool
+
+
+def get_chunk_size(num_tasks: int, max_chunk_size: Optional[int] = None,
+                   max_num_chunks: Optional[int] = None) -> int:
+    # Give each worker about 8 chunks to balance IPC overhead and load.
+    chunk_size = max(1, num_tasks // ((os.cpu_count() or 1) * 8))
+    if max_chunk_size is not None:
+        chunk_size = min(chunk_size, max_chunk_size)
+    if max_num_chunks is not None:
+        chunk_size = max(
+            chunk_size, (num_tasks + max_num_chunks - 1) // max_num_chunks)
+    return chunk_size
@@ -101,3 +101,19 @@ def test_clean_html():
                      
                  
                """  # noqa
+
+
+def test_clean_html_without_tags():
+    html_content = 'test_body\n&lt;test_entity&gt;'
+    assert c.clean_html(c.Content(html_content)) == html_content
+
+
+def test_clean_html_with_uppercase_script_tag():
+    html_content = 'a<SCRIPT>b</Script >c'
+    assert c.clean_html(c.Content(html_content)) == 'a' + ' ' * 19 + 'c'
+
+
+def test_clean_html_with_broken_tag():
+    # The bogus comment makes a range to blank beyond the end of the content.
+    html_content = '</<b>'
+    assert c.clean_html(c.Content(html_content)) == ' ' * len(html_content)
@@ -0,0 +1,75 @@
+import os
+import zipfile
+
+import shinra.dataset.arrangement as a
+
+
+def _make_zip_file(zip_file_path, files):
+    with zipfile.ZipFile(zip_file_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for (name, data) in files.items():
+            zip_file.writestr(name, data)
+
+
+def test_unzip_natively(tmp_path):
+    zip_file_path = str(tmp_path / 'a.zip')
+    _make_zip_file(zip_file_path, {'a/1.html': 'test', '2.html': 'test'})
+    output_dir = tmp_path / 'a'
+    (output_dir / 'a').mkdir(parents=True)
+    (output_dir / 'a' / '0.html').write_text('test')
+    assert a._unzip_natively(zip_file_path, str(output_dir))
+    assert sorted(os.listdir(str(output_dir))) == ['2.html', 'a']
+    assert sorted(os.listdir(str(output_dir / 'a'))) == ['0.html', '1.html']
+    assert (output_dir / 'a' / '1.html').read_text() == 'test'
+    assert sorted(os.listdir(str(tmp_path))) == ['a', 'a.zip']
+
+
+def test_unzip_natively_with_broken_zip_file(tmp_path):
+    zip_file_path = str(tmp_path / 'a.zip')
+    _make_zip_file(zip_file_path, {'1.html': 'test' * 100})
+    # Break the deflated data of the file, which follows its 30-byte local
+    # file header and its file name.
+    with open(zip_file_path, 'r+b') as f:
+        f.seek(30 + len('1.html'))
+        f.write(b'\xff')
+    output_dir = tmp_path / 'a'
+    output_dir.mkdir()
+    (output_dir / '0.html').write_text('test')
+    assert not a._unzip_natively(zip_file_path, str(output_dir))
+    assert os.listdir(str(output_dir)) == ['0.html']
+    assert sorted(os.listdir(str(tmp_path))) == ['a', 'a.zip']
+
+
+def test_unzip_natively_with_truncated_zip_file(tmp_path):
+    zip_file_path = str(tmp_path / 'a.zip')
+    _make_zip_file(zip_file_path, {'1.html': 'test' * 100})
+    with open(zip_file_path, 'r+b') as f:
+        f.truncate(os.path.getsize(zip_file_path) // 2)
+    assert not a._unzip_natively(zip_file_path, str(tmp_path / 'a'))
+
+
+def test_unzip_natively_with_broken_central_directory_offset(tmp_path):
+    zip_file_path = str(tmp_path / 'a.zip')
+    _make_zip_file(zip_file_path, {'1.html': 'test' * 100})
+    # Break the offset of the central directory in the 22-byte end of central
+    # directory record, which makes zipfile.ZipFile seek to a negative offset.
+    with open(zip_file_path, 'r+b') as f:
+        f.seek(-22 + 18, os.SEEK_END)
+        f.write(b'\xfc')
+    assert not a._unzip_natively(zip_file_path, str(tmp_path / 'a'))
+
+
+def test_unzip_natively_with_non_utf8_file_name(tmp_path):
+    zip_file_path = str(tmp_path / 'a.zip')
+    # Non-ASCII names are written with the UTF-8 flag.
+    _make_zip_file(zip_file_path, {'\u00e9.html': 'test'})
+    with open(zip_file_path, 'rb') as f:
+        data = f.read()
+    with open(zip_file_path, 'wb') as f:
+        f.write(data.replace('\u00e9'.encode('utf-8'), b'\xe9\xe9'))
+    assert not a._unzip_natively(zip_file_path, str(tmp_path / 'a'))
+
+
+def test_list_page_ids(tmp_path):
+    for page_id in (10, 2, 1):
+        (tmp_path / f'{page_id}.html').write_text('test')
+    assert list(a._list_page_ids(str(tmp_path), '.html')) == [1, 2, 10]
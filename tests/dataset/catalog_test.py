@@ -4,6 +4,9 @@ import shinra.dataset.catalog as c
 def test_clean_title():
     assert c._clean_title('伊丹空港') == '伊丹空港'
     assert c._clean_title('伊丹空港 - Wikipedia Dump 20171103') == '伊丹空港'
+    assert c._clean_title('Wikipedia Dump') == 'Wikipedia Dump'
+    assert c._clean_title('Wikipedia Dump - Wikipedia Dump 20171103') \
+        == 'Wikipedia Dump'
 
 
 def test_transpose():
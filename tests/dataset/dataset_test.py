@@ -10,6 +10,20 @@ def test_get_page_id_from_file_path():
     assert d.get_page_id_from_file_path('/tmp/12345.json.gz') == 12345
 
 
+def test_get_page_id_from_file_name():
+    assert d.get_page_id_from_file_name('12345.html') == 12345
+    assert d.get_page_id_from_file_name('12345.txt') == 12345
+    assert d.get_page_id_from_file_name('12345.json.gz') == 12345
+
+
+def test_iter_page_ids(tmp_path):
+    for file_name in ('1.html', '2.html', '3.txt'):
+        (tmp_path / file_name).write_text('test')
+    assert sorted(d.iter_page_ids(str(tmp_path), '.html')) == [1, 2]
+    assert sorted(d.iter_page_ids(str(tmp_path), '.txt')) == [3]
+    assert sorted(d.iter_page_ids(str(tmp_path / 'unknown'), '.html')) == []
+
+
 def test_get_category_from_dir_path():
     assert d.get_category_from_dir_path('') is None
     assert d.get_category_from_dir_path('/tmp/Airport') == 'Airport'
@@ -20,3 +34,4 @@ def test_get_category_from_dir_path():
     assert d.get_category_from_dir_path('tmp/Unknown') is None
     assert d.get_category_from_dir_path('tmp/Airport/HTML') == 'Airport'
     assert d.get_category_from_dir_path('tmp/Unknown/HTML') is None
+    assert d.get_category_from_dir_path('/tmp/Airport/HTML/City') == 'City'
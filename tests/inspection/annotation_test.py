@@ -1,7 +1,15 @@
+import pytest
+
 import shinra.inspection.annotation as a
 from shinra.dataset import dataset
 
 
+def test_make_trie_pattern():
+    assert a._make_trie_pattern(('a',)) == 'a'
+    assert a._make_trie_pattern(('ab', 'ac')) == 'a(?:b|c)'
+    assert a._make_trie_pattern(('a', 'ab', 'b')) == '(?:a(?:b)?|b)'
+
+
 def test_find_html_block_tag():
     assert a._find_html_block_tag('test') is None
     assert a._find_html_block_tag('test<h1>test') == '<h1>'
@@ -10,6 +18,12 @@ def test_find_html_block_tag():
     assert a._find_html_block_tag('TEST</H1>TEST') == '</h1>'
     assert a._find_html_block_tag('test<a>test') is None
     assert a._find_html_block_tag('test</a>test') is None
+    assert a._find_html_block_tag('test<thead>test') == '<thead>'
+    assert a._find_html_block_tag('test</tbody>test') == '</tbody>'
+    assert a._find_html_block_tag('test<th>test') == '<th>'
+    assert a._find_html_block_tag('test</tr>test') == '</tr>'
+    assert a._find_html_block_tag('test<theadtbody>test') is None
+    assert a._find_html_block_tag('test<thtr>test') is None
 
 
 def test_braces_paired():
@@ -21,11 +35,12 @@ def test_braces_paired():
     assert not a._braces_paired('{[}]')
 
 
-def test_is_overlapped():
-    assert not a._is_overlapped(0, 1, 1, 2)
-    assert a._is_overlapped(0, 2, 1, 2)
-    assert not a._is_overlapped(1, 2, 0, 1)
-    assert a._is_overlapped(1, 2, 0, 2)
+def test_has_leading_or_trailing_space():
+    assert not a._has_leading_or_trailing_space('')
+    assert not a._has_leading_or_trailing_space('a b')
+    assert a._has_leading_or_trailing_space(' a')
+    assert a._has_leading_or_trailing_space('a\n')
+    assert a._has_leading_or_trailing_space('\u3000a')
 
 
 def _make_test_annotation(annotation_id: int) -> dataset.Annotation:
@@ -67,3 +82,12 @@ def test_detect_overlap_annotations():
         (0, 2, annotation_1),
         (1, 2, annotation_2),
     ))) == [a._DetectOverlapAnnotationsResult(annotation_1, annotation_2)]
+    assert list(a._detect_overlap_annotations((
+        (0, 2, annotation_1),
+        (0, 2, annotation_2),
+    ))) == [a._DetectOverlapAnnotationsResult(annotation_1, annotation_2)]
+    with pytest.raises(AssertionError):
+        list(a._detect_overlap_annotations((
+            (0, 2, annotation_1),
+            (1, 1, annotation_2),
+        )))
@@ -0,0 +1,8 @@
+import shinra.inspection.page as p
+
+
+def test_contains_html_reserved_character():
+    assert not p._contains_html_reserved_character('test')
+    assert not p._contains_html_reserved_character('&lt;test&gt;')
+    assert p._contains_html_reserved_character('<test')
+    assert p._contains_html_reserved_character('test>')
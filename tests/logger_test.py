@@ -0,0 +1,18 @@
+import logging
+
+import shinra.logger as lg
+
+
+def test_get_logger(monkeypatch):
+    root_logger = logging.getLogger()
+    # Remove handlers added by pytest and restore them and the level later.
+    monkeypatch.setattr(root_logger, 'handlers', [])
+    monkeypatch.setattr(root_logger, 'level', root_logger.level)
+    logger = lg.get_logger()
+    assert logger is root_logger
+    assert lg.get_logger('DEBUG') is logger
+    assert len(logger.handlers) == 1
+    (handler,) = logger.handlers
+    assert isinstance(handler, logging.StreamHandler)
+    assert handler.level == logging.DEBUG
+    assert logger.isEnabledFor(logging.DEBUG)
@@ -0,0 +1,20 @@
+import shinra.util as u
+
+
+def test_get_chunk_size(monkeypatch):
+    monkeypatch.setattr(u.os, 'cpu_count', lambda: 128)
+    assert u.get_chunk_size(0) == 1
+    assert u.get_chunk_size(100) == 1
+    assert u.get_chunk_size(10240) == 10
+    assert u.get_chunk_size(1024000, max_chunk_size=100) == 100
+    # The number of chunks is capped, e.g. not to open too many files.
+    for num_tasks in (256, 257, 10000, 1000000):
+        chunk_size = u.get_chunk_size(num_tasks, max_num_chunks=256)
+        assert (num_tasks + chunk_size - 1) // chunk_size <= 256
+
+
+def test_ensure_pool():
+    with u.ensure_pool() as pool:
+        assert pool.apply(abs, (-1,)) == 1
+        with u.ensure_pool(pool) as shared_pool:
+            assert shared_pool is pool